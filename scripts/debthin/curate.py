@@ -15,11 +15,16 @@ import sys
 import json
 import logging
 import urllib.request
-from collections import defaultdict
+from collections import defaultdict, deque
 from pathlib import Path
 
 POPCON_URL = "https://popcon.debian.org/main/by_inst.gz"
 CONFIG_FILE = "config.json"
+STREAM_CHUNK_SIZE = 1024 * 1024
+POPCON_MIN_INSTALLS = 2500
+
+# "Key: value" fields of a Packages stanza; indented continuation lines never match
+FIELD_RE = re.compile(r"^([\w-]+): (.*)$", re.M)
 
 # Sections that are relevant for server containers
 SERVER_SECTIONS = {
@@ -64,33 +69,30 @@ def get_required_packages(distro: str, suite: str) -> set[str]:
     print(f"  WARNING: No required packages lists found. Base packages may be omitted.", file=sys.stderr)
     return set()
 
-def fetch_url(url: str, delay: int = 0) -> bytes:
-    import time
-    if delay > 0:
-        time.sleep(delay)
+def open_url(url: str):
+    """Open a streaming response; callers decompress while the body downloads."""
     print(f"  Fetching {url}", file=sys.stderr)
     req = urllib.request.Request(url, headers={"User-Agent": "debian-slim-mirror/1.0"})
-    with urllib.request.urlopen(req, timeout=60) as r:
-        return r.read()
+    return urllib.request.urlopen(req, timeout=60)
 
 
 def fetch_popcon() -> dict[str, int]:
     """Returns {package: install_count}"""
-    data = fetch_url(POPCON_URL)
-    text = gzip.decompress(data).decode("utf-8", errors="replace")
     result = {}
-    for line in text.splitlines():
-        if line.startswith("#") or not line.strip():
-            continue
-        parts = line.split()
-        if len(parts) >= 2:
+    with open_url(POPCON_URL) as resp, gzip.GzipFile(fileobj=resp) as gz:
+        # Stay in bytes: only the package name is ever decoded
+        for line in gz:
+            if line[:1] == b"#":
+                continue
+            # Format: rank, package, inst, vote, old, recent, no-files
+            parts = line.split(None, 3)
+            if len(parts) < 3:
+                continue
             try:
-                # Format: rank, package, inst, vote, old, recent, no-files
-                pkg = parts[1]
                 inst = int(parts[2])
-                result[pkg] = inst
-            except (ValueError, IndexError):
+            except ValueError:
                 continue
+            result[parts[1].decode("utf-8", errors="replace")] = inst
     print(f"  Loaded {len(result)} packages from popcon", file=sys.stderr)
     return result
 
@@ -98,25 +100,23 @@ def fetch_popcon() -> dict[str, int]:
 def fetch_packages_index(upstream: str, suite: str, arch: str) -> dict[str, dict]:
     """Returns {package_name: {section, depends, version, ...}}"""
     url = f"{upstream}/dists/{suite}/main/binary-{arch}/Packages.gz"
-    data = fetch_url(url)
-    text = gzip.decompress(data).decode("utf-8", errors="replace")
 
     packages = {}
-    current = {}
-    for line in text.splitlines():
-        if line == "":
-            if "Package" in current:
-                packages[current["Package"]] = current
-            current = {}
-        elif line.startswith(" "):
-            # Continuation line, skip for our purposes
-            pass
-        elif ": " in line:
-            key, _, val = line.partition(": ")
-            current[key] = val
-
-    if "Package" in current:
-        packages[current["Package"]] = current
+
+    def add_stanza(stanza: str) -> None:
+        fields = dict(FIELD_RE.findall(stanza))
+        if "Package" in fields:
+            packages[fields["Package"]] = fields
+
+    with open_url(url) as resp, gzip.GzipFile(fileobj=resp) as gz:
+        text = io.TextIOWrapper(gz, encoding="utf-8", errors="replace")
+        tail = ""
+        while chunk := text.read(STREAM_CHUNK_SIZE):
+            # The last piece may be a partial stanza; carry it into the next chunk
+            *stanzas, tail = (tail + chunk).split("\n\n")
+            for stanza in stanzas:
+                add_stanza(stanza)
+        add_stanza(tail)
 
     print(f"  Loaded {len(packages)} packages from {suite}/{arch}", file=sys.stderr)
     return packages
@@ -146,12 +146,13 @@ def resolve_dependencies(
     Returns set of dependency packages not already in primary, up to dep_budget.
     """
     deps = set()
-    queue = list(primary)
+    queue = deque(primary)
     seen = set(primary)
+    packages_get = packages.get
 
     while queue and len(deps) < dep_budget:
-        pkg = queue.pop(0)
-        info = packages.get(pkg, {})
+        pkg = queue.popleft()
+        info = packages_get(pkg, {})
         dep_str = info.get("Depends", "")
         if not dep_str:
             continue
@@ -174,11 +175,12 @@ DESKTOP_NAME_PREFIXES = (
 )
 
 def is_server_relevant(info: dict) -> bool:
-    pkg = info.get("Package", "")
+    # Section set lookup rejects most packages before the name check runs
     section = info.get("Section", "").lower().split("/")[-1]
-    if any(pkg.startswith(p) for p in DESKTOP_NAME_PREFIXES):
+    if section not in SERVER_SECTIONS:
         return False
-    return section in SERVER_SECTIONS
+    # str.startswith with a tuple tests every prefix in one C call
+    return not info.get("Package", "").startswith(DESKTOP_NAME_PREFIXES)
 
 def build_curated_list(
     distro: str,
@@ -204,20 +206,12 @@ def build_curated_list(
     print(f"\nFiltering and ranking...", file=sys.stderr)
 
 
-    scored = []
-    for pkg, info in packages.items():
-        if not is_server_relevant(info):
-            continue
-        score = popcon.get(pkg, 0)
-        scored.append((score, pkg))
-
-    scored.sort(reverse=True)
-
-    primary = set()
-    for score, pkg in scored:
-        if score < 2500:
-            break
-        primary.add(pkg)
+    # Threshold first: only a few hundred packages clear it, so nothing needs sorting
+    popcon_get = popcon.get
+    primary = {
+        pkg for pkg, info in packages.items()
+        if popcon_get(pkg, 0) >= POPCON_MIN_INSTALLS and is_server_relevant(info)
+    }
 
     # Force include critical packages regardless of popcon score
     required_packages = get_required_packages(distro, suite)
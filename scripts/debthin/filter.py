@@ -11,14 +11,21 @@ Usage:
 """
 
 import argparse
-import gzip
+import functools
 import json
 import lzma
+import multiprocessing
 import os
 import re
 import sys
 from pathlib import Path
-from typing import Set, Tuple, List
+from typing import FrozenSet, Set, Tuple, List
+
+# ISA-L's igzip is a drop-in, several times faster DEFLATE; fall back to zlib.
+try:
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
 
 PASSTHROUGH_THRESHOLD = 100
 PKG_PREFIX = b"Package: "
@@ -36,35 +43,76 @@ def count_packages(raw: bytes) -> int:
     return raw.count(b"\nPackage: ") + (1 if raw.startswith(b"Package: ") else 0)
 
 
+# Strip t64 suffix from base name (but preserve trailing components like -dbg)
+T64_RE = re.compile(b't64(-|$)')
+# Generic rule: strip hyphenated versions like -14, -3.12, etc anywhere in the name
+HYPHEN_VERSION_RE = re.compile(b'-[0-9]+(?:\\.[0-9]+)*(?=-|$)')
+# Generic rule: strip dot versions directly attached to names like python3.12 or gir1.2
+DOT_VERSION_RE = re.compile(b'([a-z]+)[0-9]+\\.[0-9]+(?=-|$)')
+
+
+# Memoized: the same names recur in every arch/component a worker filters
+@functools.lru_cache(maxsize=None)
 def generalize_name(pkg_name: bytes) -> bytes:
     """Safely strip volatile version/architecture suffixes from package names."""
-    # Strip t64 suffix from base name (but preserve trailing components like -dbg)
-    name = re.sub(b't64(-|$)', b'\\1', pkg_name)
-    # Generic rule: strip hyphenated versions like -14, -3.12, etc anywhere in the name
-    name = re.sub(b'-[0-9]+(?:\\.[0-9]+)*(?=-|$)', b'-', name)
-    # Generic rule: strip dot versions directly attached to names like python3.12 or gir1.2
-    name = re.sub(b'([a-z]+)[0-9]+\\.[0-9]+(?=-|$)', b'\\1.', name)
+    name = T64_RE.sub(b'\\1', pkg_name)
+    name = HYPHEN_VERSION_RE.sub(b'-', name)
+    name = DOT_VERSION_RE.sub(b'\\1.', name)
     return name
 
 
-def filter_packages(raw: bytes, allowed: set, gen_allowed: set) -> bytes:
+def iter_stanzas(raw: bytes):
+    """
+    Yield (start, end) offsets of each non-empty stanza in raw. Boundaries
+    are found with bytes.find, so no per-stanza objects are allocated.
+    """
+    find = raw.find
+    pos = 0
+    n = len(raw)
+    while pos < n:
+        end = find(b"\n\n", pos)
+        if end == -1:
+            end = n
+        if end > pos:
+            yield pos, end
+        pos = end + 2
+
+
+def field_value(raw: bytes, start: int, end: int, prefix: bytes = PKG_PREFIX):
+    """Return the value of the `prefix` field in stanza raw[start:end], or None."""
+    if not raw.startswith(prefix, start):
+        idx = raw.find(b"\n" + prefix, start, end)
+        if idx == -1:
+            return None
+        start = idx + 1
+    line_end = raw.find(b"\n", start, end)
+    if line_end == -1:
+        line_end = end
+    return raw[start + len(prefix):line_end]
+
+
+def filter_packages(raw: bytes, allowed: FrozenSet[bytes], gen_allowed: FrozenSet[bytes]) -> Tuple[bytes, int]:
+    """Returns (gzip-compressed kept stanzas, number of stanzas kept)."""
+    # Keep zero-copy views of the kept stanzas rather than splitting the
+    # whole index into new objects.
     out = []
-    for stanza in raw.split(b"\n\n"):
-        if not stanza:
-            continue
-        for line in stanza.split(b"\n", 3):
-            if line.startswith(PKG_PREFIX):
-                pkg_name = line[len(PKG_PREFIX):]
-                if pkg_name in allowed or generalize_name(pkg_name) in gen_allowed:
-                    out.append(stanza)
-                break
-    result = b"\n\n".join(out)
-    if result:
-        result += b"\n"
-    return gzip.compress(result, compresslevel=1)
-
-
-def process_one(input_path: str, output_path: str, allowed: set, gen_allowed: set, stats: bool) -> None:
+    view = memoryview(raw)
+    # Bound methods skip the attribute lookup on every stanza
+    allowed_contains = allowed.__contains__
+    gen_allowed_contains = gen_allowed.__contains__
+    n = len(raw)
+    for start, end in iter_stanzas(raw):
+        pkg_name = field_value(raw, start, end)
+        if pkg_name is not None and (allowed_contains(pkg_name) or gen_allowed_contains(generalize_name(pkg_name))):
+            # Take each stanza with its own trailing newline so joining on
+            # b"\n" yields the final output directly, without copying the
+            # joined buffer again to append a terminator
+            out.append(view[start:end + 1] if end < n else raw[start:end] + b"\n")
+    return gzip.compress(b"\n".join(out), compresslevel=1, mtime=0), len(out)
+
+
+def process_one(input_path: str, output_path: str, allowed: FrozenSet[bytes],
+                gen_allowed: FrozenSet[bytes], stats: bool) -> None:
     raw_input = Path(input_path).read_bytes()
     raw = decompress(raw_input, input_path)
     total_in = count_packages(raw)
@@ -73,22 +121,41 @@ def process_one(input_path: str, output_path: str, allowed: set, gen_allowed: se
     count_path = Path(input_path).with_suffix(".count")
     count_path.write_text(str(total_in))
 
-    if stats:
-        print(f"  {input_path}: {total_in} packages", file=sys.stderr)
+    # Emitted as a single write so lines from parallel workers don't interleave
+    report = f"  {input_path}: {total_in} packages"
 
     if total_in < PASSTHROUGH_THRESHOLD:
-        filtered = gzip.compress(raw, compresslevel=1)
+        filtered = gzip.compress(raw, compresslevel=1, mtime=0)
     else:
-        filtered = filter_packages(raw, allowed, gen_allowed)
+        filtered, total_out = filter_packages(raw, allowed, gen_allowed)
         if stats:
-            total_out = count_packages(gzip.decompress(filtered))
             pct = (1 - total_out / total_in) * 100
-            print(f"    → {total_out} ({pct:.0f}% reduction)", file=sys.stderr)
+            report += f"\n    → {total_out} ({pct:.0f}% reduction)"
+
+    if stats:
+        print(report, file=sys.stderr)
 
     Path(output_path).parent.mkdir(parents=True, exist_ok=True)
     Path(output_path).write_bytes(filtered)
 
 
+# Allowlists for pool workers, set once per process by init_worker(). Under
+# fork the sets are inherited copy-on-write rather than pickled per job.
+WORKER_ALLOWED: FrozenSet[bytes] = frozenset()
+WORKER_GEN_ALLOWED: FrozenSet[bytes] = frozenset()
+
+
+def init_worker(allowed: FrozenSet[bytes], gen_allowed: FrozenSet[bytes]) -> None:
+    global WORKER_ALLOWED, WORKER_GEN_ALLOWED
+    WORKER_ALLOWED = allowed
+    WORKER_GEN_ALLOWED = gen_allowed
+
+
+def run_job(job: Tuple[str, str, bool]) -> None:
+    input_path, output_path, stats = job
+    process_one(input_path, output_path, WORKER_ALLOWED, WORKER_GEN_ALLOWED, stats)
+
+
 def resolve_allowlist(config_path: str, distro: str, suite: str) -> Tuple[str, List[str]]:
     """Resolves primary allowed list and dependencies following original bash loop."""
     try:
@@ -146,6 +213,9 @@ def main():
     parser.add_argument("suite", help="Target suite")
     parser.add_argument("--config", default="config.json", help="Config file")
     parser.add_argument("--stats", action="store_true", default=True, help="Print stats to stderr")
+    # make -j already runs one filter.py per suite; only raise this when
+    # filtering a single suite, or the pools multiply across make jobs
+    parser.add_argument("--workers", type=int, default=1, help="Parallel filter processes")
     args = parser.parse_args()
 
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -170,7 +240,8 @@ def main():
             if p:
                 allowed_set.add(p.encode())
                 
-    gen_allowed = {generalize_name(p) for p in allowed_set}
+    allowed_set = frozenset(allowed_set)
+    gen_allowed = frozenset(generalize_name(p) for p in allowed_set)
     
     # Find jobs via fs traversal
     cache_dir = f".tmp_cache/{args.distro}/{args.suite}"
@@ -205,8 +276,20 @@ def main():
     if args.stats:
         print(f"Batch: {len(jobs)} jobs, allowed list: {len(allowed_set)}", file=sys.stderr)
 
-    for input_path, output_path in sorted(jobs, key=lambda x: x[0]):
-        process_one(input_path, output_path, allowed_set, gen_allowed, args.stats)
+    # Largest indexes first, so a big main/binary-amd64 doesn't start last and
+    # leave the rest of the pool idle while it finishes
+    jobs = [(i, o, args.stats) for i, o in sorted(jobs, key=lambda x: os.path.getsize(x[0]), reverse=True)]
+    workers = min(args.workers, len(jobs))
+
+    if workers > 1:
+        with multiprocessing.Pool(workers, initializer=init_worker,
+                                  initargs=(allowed_set, gen_allowed)) as pool:
+            for _ in pool.imap_unordered(run_job, jobs):
+                pass
+    else:
+        init_worker(allowed_set, gen_allowed)
+        for job in jobs:
+            run_job(job)
 
 
 if __name__ == "__main__":
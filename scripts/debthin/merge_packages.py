@@ -4,6 +4,8 @@ import os
 import argparse
 from pathlib import Path
 
+from filter import field_value, iter_stanzas
+
 def parse_version(v):
     epoch = 0
     if ":" in v:
@@ -71,19 +73,11 @@ def compare_versions(a, b):
     return compare_version_part(pa[2], pb[2])
 
 def parse_stanzas(raw_bytes):
-    stanzas = raw_bytes.split(b"\n\n")
-    for stanza in stanzas:
-        if not stanza.strip():
-            continue
-        pkg_name = None
-        version = None
-        for line in stanza.split(b"\n"):
-            if line.startswith(b"Package: "):
-                pkg_name = line[9:]
-            elif line.startswith(b"Version: "):
-                version = line[9:]
+    for start, end in iter_stanzas(raw_bytes):
+        pkg_name = field_value(raw_bytes, start, end, b"Package: ")
+        version = field_value(raw_bytes, start, end, b"Version: ")
         if pkg_name and version:
-            yield pkg_name, version, stanza
+            yield pkg_name, version, raw_bytes[start:end]
 
 def main():
     parser = argparse.ArgumentParser()
@@ -112,8 +106,9 @@ def main():
         result += b"\n"
         
     Path(args.output).parent.mkdir(parents=True, exist_ok=True)
-    with gzip.open(args.output, "wb", compresslevel=1) as f:
-        f.write(result)
+    # mtime=0 keeps the header free of the build time, so unchanged content
+    # is byte-identical across runs and r2_upload can skip or dedupe it
+    Path(args.output).write_bytes(gzip.compress(result, compresslevel=1, mtime=0))
 
 if __name__ == "__main__":
     main()
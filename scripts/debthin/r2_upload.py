@@ -19,154 +19,459 @@ Requires: boto3 (pip install boto3)
 """
 
 import argparse
+import contextlib
 import hashlib
 import json
+import mmap
 import os
 import sys
+import time
 from collections import defaultdict
 from pathlib import Path
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
+from validate import parse_inrelease_hashes
+
+UPLOAD_WORKERS = 16
+MAX_ATTEMPTS = 5
+# Seconds between upload progress lines
+PROGRESS_INTERVAL = 5.0
+
+# Suite files the worker derives itself (Release is InRelease with the PGP
+# armour stripped), so they are never read from R2 and need not be uploaded.
+DERIVED_FILES = {"Release"}
+
+# Files that reference other objects by path or hash. They are uploaded only
+# once every Packages.gz PUT and copy has landed, so clients never see an
+# InRelease or by-hash index pointing at content that isn't in place yet.
+SUITE_METADATA_FILES = {"InRelease", "Release.gpg", "by-hash-index.json"}
+
+
+CONTENT_TYPES = {
+    ".gz":   "application/x-gzip",
+    ".lz4":  "application/x-lz4",
+    ".xz":   "application/x-xz",
+    ".gpg":  "application/pgp-keys",
+    ".html": "text/html; charset=utf-8",
+    ".json": "application/json",
+    ".ico":  "image/x-icon",
+}
+
 
 def content_type_for(path: str) -> str:
-    if path.endswith(".gz"):   return "application/x-gzip"
-    if path.endswith(".lz4"):  return "application/x-lz4"
-    if path.endswith(".xz"):   return "application/x-xz"
-    if path.endswith(".gpg"):  return "application/pgp-keys"
-    if path.endswith(".html"): return "text/html; charset=utf-8"
-    if path.endswith(".json"): return "application/json"
-    if path.endswith(".ico"):  return "image/x-icon"
-    return "text/plain; charset=utf-8"
+    return CONTENT_TYPES.get(os.path.splitext(path)[1], "text/plain; charset=utf-8")
+
+
+def iter_files(root: str):
+    """Yield file paths under root; DirEntry type checks reuse the dirent data."""
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_files(entry.path)
+            elif entry.is_file():
+                yield entry.path
+
+
+# Files at least this large are hashed through mmap rather than read() copies
+MMAP_THRESHOLD = 4 * 1024 * 1024
+# Objects at or above the threshold are sent as parallel multipart uploads.
+# The part size must match what multipart_etag() assumes when skip-checking.
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+MULTIPART_CHUNK_SIZE = 16 * 1024 * 1024
+# Parts in flight per large object; kept small because each runs alongside
+# the other upload workers on the same connection pool
+MULTIPART_CONCURRENCY = 4
+
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=MULTIPART_THRESHOLD,
+    multipart_chunksize=MULTIPART_CHUNK_SIZE,
+    max_concurrency=MULTIPART_CONCURRENCY,
+)
+
+
+@contextlib.contextmanager
+def file_contents(path: str):
+    """
+    Yields a file's contents as a buffer. Large files are memory-mapped, so
+    hashers read the page cache directly instead of a copy in a bytes object.
+    """
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size < MMAP_THRESHOLD:
+            yield fh.read()
+            return
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield mm
+
 
+def hash_file(path: str, algorithms) -> dict:
+    """Compute several digests of a file in one pass: {algorithm: hex}."""
+    hashers = {a: hashlib.new(a) for a in algorithms}
+    with file_contents(path) as data:
+        for h in hashers.values():
+            h.update(data)
+    return {a: h.hexdigest() for a, h in hashers.items()}
 
-def build_hash_indexes(directory: Path) -> dict:
+
+def multipart_etag(path: str, part_size: int = MULTIPART_CHUNK_SIZE) -> str:
+    """
+    ETag S3/R2 assign to a multipart upload: MD5 of the concatenated part
+    MD5s, suffixed with the part count.
     """
-    Returns {key: bytes} for one by-hash-index.json per distro.
-    JSON maps sha256 -> relative path from distro root e.g.:
+    with file_contents(path) as data, memoryview(data) as view:
+        part_digests = [hashlib.md5(view[i:i + part_size]).digest()
+                        for i in range(0, len(view), part_size)]
+    return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def is_suite_metadata(key: str) -> bool:
+    return key.startswith("dists/") and os.path.basename(key) in SUITE_METADATA_FILES
+
+
+def is_hash_indexed(key: str) -> bool:
+    """Packages.gz files under dists/<distro>/ are listed in by-hash indexes."""
+    parts = key.split("/")
+    return len(parts) >= 3 and parts[0] == "dists" and parts[-1] == "Packages.gz"
+
+
+def load_release_hashes(files: dict) -> dict:
+    """
+    Returns {key: {"size": n, "md5": hex, "sha256": hex}} for every file
+    listed in a suite's InRelease. sign_all.py already hashed them and
+    validate.py has checked both the MD5Sum and SHA256 sections against the
+    tree, so they need not be hashed again here: the MD5 is compared with
+    the R2 ETag directly.
+    """
+    known = {}
+    for key, path in files.items():
+        if os.path.basename(key) != "InRelease" or not key.startswith("dists/"):
+            continue
+        suite_dir = os.path.dirname(key)
+        for section, algorithm in (("MD5Sum", "md5"), ("SHA256", "sha256")):
+            for digest, size, rel_path in parse_inrelease_hashes(path, section):
+                entry = known.setdefault(f"{suite_dir}/{rel_path}", {"size": size})
+                if entry["size"] == size:
+                    entry[algorithm] = digest
+    return known
+
+
+def build_hash_indexes(sha256s: dict) -> dict:
+    """
+    Returns {key: mapping} for one by-hash-index.json per distro.
+    Each mapping is sha256 -> relative path from distro root e.g.:
       "abc123...": "trixie/main/binary-amd64/Packages.gz"
+    sha256s maps each Packages.gz upload key to its digest.
     """
     distro_hashes = defaultdict(dict)
 
-    for f in sorted(directory.rglob("Packages.gz")):
-        key = str(f.relative_to(directory))
+    for key in sorted(sha256s):
         parts = key.split("/")
-        if len(parts) < 3 or parts[0] != "dists":
-            continue
         distro_prefix   = "/".join(parts[:2])   # dists/debian
         rel_from_distro = "/".join(parts[2:])   # trixie/main/binary-amd64/Packages.gz
-        sha256 = hashlib.sha256(f.read_bytes()).hexdigest()
-        distro_hashes[distro_prefix][sha256] = rel_from_distro
+        distro_hashes[distro_prefix][sha256s[key]] = rel_from_distro
 
     return {
-        f"{prefix}/by-hash-index.json": json.dumps(mapping, sort_keys=True).encode()
+        f"{prefix}/by-hash-index.json": mapping
         for prefix, mapping in distro_hashes.items()
     }
 
 
-def make_client(account_id: str, access_key: str, secret_key: str):
+def make_client(account_id: str, access_key: str, secret_key: str,
+                max_pool_connections: int = UPLOAD_WORKERS):
+    # botocore keeps 10 pooled connections by default; with more upload
+    # threads than that, connections are discarded and re-handshaked.
+    # "standard" retries back off exponentially on 429/5xx and throttling.
     return boto3.client(
         "s3",
         endpoint_url=f"https://{account_id}.r2.cloudflarestorage.com",
         aws_access_key_id=access_key,
         aws_secret_access_key=secret_key,
         region_name="auto",
+        config=Config(
+            max_pool_connections=max_pool_connections,
+            retries={"max_attempts": MAX_ATTEMPTS, "mode": "standard"},
+        ),
     )
 
 
-def list_r2_objects(client, bucket: str) -> dict:
-    objects = {}
+def _list_prefix(client, bucket: str, prefix: str, delimiter: str = "") -> tuple:
+    """
+    Lists one prefix. Returns ({key: (etag, size)}, [common prefixes]); the
+    prefixes list is only populated when a delimiter is given.
+    """
+    objects, prefixes = {}, []
+    params = {"Bucket": bucket, "Prefix": prefix}
+    if delimiter:
+        params["Delimiter"] = delimiter
     paginator = client.get_paginator("list_objects_v2")
-    for page in paginator.paginate(Bucket=bucket):
+    for page in paginator.paginate(**params):
         for obj in page.get("Contents", []):
-            objects[obj["Key"]] = obj.get("ETag", "").strip('"')
+            objects[obj["Key"]] = (obj.get("ETag", "").strip('"'), obj.get("Size"))
+        prefixes.extend(p["Prefix"] for p in page.get("CommonPrefixes", []))
+    return objects, prefixes
+
+
+def list_r2_objects(client, bucket: str, workers: int = UPLOAD_WORKERS) -> dict:
+    """
+    Returns {key: (etag, size)} for every object in the bucket.
+
+    ListObjectsV2 is paginated 1000 keys at a time, so a single walk is a long
+    chain of round trips. Shards are discovered from the bucket itself
+    (top-level prefixes, and dists/<distro>/ below dists/) rather than from
+    the local tree, so prefixes that no longer exist locally are still listed
+    and their objects pruned as stale. The shards are then walked in parallel.
+    """
+    objects, top = _list_prefix(client, bucket, "", "/")
+    shards = []
+    for prefix in top:
+        if prefix == "dists/":
+            dist_objects, distros = _list_prefix(client, bucket, prefix, "/")
+            objects.update(dist_objects)
+            shards.extend(distros)
+        else:
+            shards.append(prefix)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for shard_objects, _ in pool.map(lambda p: _list_prefix(client, bucket, p), shards):
+            objects.update(shard_objects)
     return objects
 
 
-UPLOAD_WORKERS = 16
+def source_size(source) -> int:
+    """Uploads are local file paths, or bytes for generated objects."""
+    return len(source) if isinstance(source, bytes) else os.path.getsize(source)
 
 
 def _put_one(args):
-    client, bucket, key, data, dry_run = args
+    """
+    Uploads one object. Files are streamed from an open handle, so the
+    payload is never copied into a Python bytes object first. Large files
+    go through the multipart transfer manager.
+    """
+    client, bucket, key, source, dry_run = args
     ct = content_type_for(key)
+    size = source_size(source)
     if dry_run:
-        return key, len(data), None
+        return key, size, None
     try:
-        client.put_object(
-            Bucket=bucket,
-            Key=key,
-            Body=data,
-            ContentType=ct,
-            CacheControl="public, max-age=3600",
-        )
-        return key, len(data), None
+        with contextlib.ExitStack() as stack:
+            body = source if isinstance(source, bytes) else stack.enter_context(open(source, "rb"))
+            if size >= MULTIPART_THRESHOLD and not isinstance(source, bytes):
+                client.upload_fileobj(
+                    body, bucket, key,
+                    ExtraArgs={"ContentType": ct, "CacheControl": "public, max-age=3600"},
+                    Config=TRANSFER_CONFIG,
+                )
+            else:
+                client.put_object(
+                    Bucket=bucket,
+                    Key=key,
+                    Body=body,
+                    ContentType=ct,
+                    CacheControl="public, max-age=3600",
+                )
+        return key, size, None
     except Exception as e:
-        return key, len(data), str(e)
+        return key, size, str(e)
 
 
-def delete_keys(client, bucket: str, keys: list, dry_run: bool = False):
-    for i in range(0, len(keys), 1000):
-        batch = [{"Key": k} for k in keys[i:i + 1000]]
-        if dry_run:
+def _copy_one(args):
+    """Server-side copy of an already uploaded object with identical content."""
+    client, bucket, key, source_key, size, dry_run = args
+    if dry_run:
+        return key, size, None
+    try:
+        client.copy_object(Bucket=bucket, Key=key, CopySource={"Bucket": bucket, "Key": source_key})
+        return key, size, None
+    except Exception as e:
+        return key, size, str(e)
+
+
+def delete_keys(client, bucket: str, keys: list, dry_run: bool = False,
+                workers: int = UPLOAD_WORKERS):
+    """
+    Deletes keys in DeleteObjects batches of 1000, several batches at a time.
+    Quiet mode limits each response to the keys that failed.
+    """
+    batches = [[{"Key": k} for k in keys[i:i + 1000]] for i in range(0, len(keys), 1000)]
+    if dry_run:
+        for batch in batches:
             for k in batch:
                 print(f"  [dry-run] DELETE {k['Key']}")
-            continue
-        client.delete_objects(Bucket=bucket, Delete={"Objects": batch})
+        return
 
+    def delete_batch(batch):
+        response = client.delete_objects(Bucket=bucket, Delete={"Objects": batch, "Quiet": True})
+        return response.get("Errors", [])
 
-def sync(directory: Path, account_id: str, access_key: str,
-         secret_key: str, bucket: str, dry_run: bool = False,
-         workers: int = UPLOAD_WORKERS):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for errors in pool.map(delete_batch, batches):
+            for e in errors:
+                print(f"  ERROR deleting {e.get('Key')}: {e.get('Message')}", file=sys.stderr)
 
-    client = make_client(account_id, access_key, secret_key)
 
-    uploads: dict[str, bytes] = {}
-    for f in sorted(directory.rglob("*")):
-        if not f.is_file():
-            continue
-        key = str(f.relative_to(directory))
-        uploads[key] = f.read_bytes()
+def sync(directory: Path, account_id: str, access_key: str,
+         secret_key: str, bucket: str, dry_run: bool = False,
+         workers: int = UPLOAD_WORKERS, verbose: bool = False):
 
-    hash_indexes = build_hash_indexes(directory)
-    for key, data in sorted(hash_indexes.items()):
-        uploads[key] = data
-        count = len(json.loads(data))
-        print(f"  Hash index {key}: {count} entries", file=sys.stderr)
+    client = make_client(account_id, access_key, secret_key, max_pool_connections=workers)
 
+    # The listing is only needed once the local tree has been walked, so it
+    # runs in the background meanwhile
     print("Fetching existing R2 objects...", file=sys.stderr)
-    existing_objects = list_r2_objects(client, bucket)
-
+    lister = ThreadPoolExecutor(max_workers=1)
+    listing = lister.submit(list_r2_objects, client, bucket, workers)
+    lister.shutdown(wait=False)
+
+    root = str(directory)
+    # scandir joins entry paths onto root verbatim, so keys are a plain slice
+    root_len = len(os.path.join(root, ""))
+    files = {}
+    for path in iter_files(root):
+        key = path[root_len:]
+        if key.startswith("dists/") and os.path.basename(key) in DERIVED_FILES:
+            continue
+        files[key] = path
+
+    release_hashes = load_release_hashes(files)
+
+    existing_objects = listing.result()
+
+    def scan(item):
+        """
+        At most one read per file, and none for files InRelease lists: MD5
+        only when a same-size remote object exists (sizes come free with the
+        listing), SHA256 only for by-hash indexed files.
+        """
+        key, path = item
+        size = os.path.getsize(path)
+        remote = existing_objects.get(key)
+        known = release_hashes.get(key)
+        if not known or known["size"] != size:
+            known = {}
+        algorithms = []
+        unchanged = False
+        if remote and remote[1] == size:
+            if "-" in remote[0]:
+                # Multipart objects carry a composite ETag, never a plain MD5
+                unchanged = multipart_etag(path) == remote[0]
+            elif "md5" in known:
+                unchanged = known["md5"] == remote[0]
+            else:
+                algorithms.append("md5")
+        sha256 = known.get("sha256") if is_hash_indexed(key) else None
+        if is_hash_indexed(key) and not sha256:
+            algorithms.append("sha256")
+        digests = hash_file(path, algorithms) if algorithms else {}
+        if "md5" in digests:
+            unchanged = digests["md5"] == remote[0]
+        return sha256 or digests.get("sha256"), unchanged
+
+    # Reads and hashes release the GIL, so a thread pool overlaps the per-file
+    # syscall latency across the many small index files
+    items = sorted(files.items())
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        scanned = list(pool.map(scan, items))
+
+    # Upload sources are paths, read at PUT time, so memory holds keys only
+    uploads: dict = {}
     jobs = []
     skipped = 0
-    for key, data in sorted(uploads.items()):
-        md5_hash = hashlib.md5(data).hexdigest()
-        if key in existing_objects and existing_objects[key] == md5_hash:
+    sha256s = {}
+    # Identical Packages.gz across arches/components share a sha256; the
+    # payload is sent once and the rest are server-side copies of it
+    first_by_sha256 = {}
+    copies = []
+    for (key, path), (sha256, same) in zip(items, scanned):
+        uploads[key] = path
+        if sha256:
+            sha256s[key] = sha256
+        if same:
             skipped += 1
-            continue
-        jobs.append((client, bucket, key, data, dry_run))
+            if sha256:
+                first_by_sha256.setdefault(sha256, key)
+        elif sha256 in first_by_sha256:
+            copies.append((client, bucket, key, first_by_sha256[sha256], os.path.getsize(path), dry_run))
+        else:
+            if sha256:
+                first_by_sha256[sha256] = key
+            jobs.append((client, bucket, key, path, dry_run))
+
+    hash_indexes = build_hash_indexes(sha256s)
+    for key, mapping in sorted(hash_indexes.items()):
+        data = json.dumps(mapping, sort_keys=True, separators=(",", ":")).encode()
+        uploads[key] = data
+        print(f"  Hash index {key}: {len(mapping)} entries", file=sys.stderr)
+        remote = existing_objects.get(key)
+        if remote and remote[1] == len(data) and remote[0] == hashlib.md5(data).hexdigest():
+            skipped += 1
+        else:
+            jobs.append((client, bucket, key, data, dry_run))
 
     if skipped > 0:
         print(f"Skipped {skipped} unchanged objects.", file=sys.stderr)
 
-    total_jobs = len(jobs)
+    total_jobs = len(jobs) + len(copies)
     if total_jobs > 0:
         print(f"Uploading {total_jobs} objects to R2 bucket '{bucket}' ({workers} workers)...", file=sys.stderr)
         if "config.json" in uploads and [j for j in jobs if j[2] == "config.json"]:
-            size = len(uploads["config.json"])
+            size = source_size(uploads["config.json"])
             print(f"  Found config.json ({size} bytes) in upload queue", file=sys.stderr)
     if total_jobs > 0:
         errors = []
+        failed = set()
         done = 0
-        with ThreadPoolExecutor(max_workers=workers) as pool:
-            for key, size, err in pool.map(_put_one, jobs):
+        last_report = time.monotonic()
+
+        def run_phase(pool, fn, phase, verb):
+            """
+            Every request in the phase is in flight up front; results are
+            drained as they land so one slow large object doesn't hold back
+            progress and error reporting.
+            """
+            nonlocal done, last_report
+            futures = [pool.submit(fn, job) for job in phase]
+            for future in as_completed(futures):
+                key, size, err = future.result()
                 done += 1
                 if err:
+                    failed.add(key)
                     errors.append(f"{key}: {err}")
                     print(f"  ERROR {key}: {err}", file=sys.stderr)
-                elif done % 50 == 0 or done == total_jobs:
+                    continue
+                if verbose:
+                    print(f"  {verb} {key} ({size} bytes)", file=sys.stderr)
+                # Progress is throttled by time, not per object
+                now = time.monotonic()
+                if now - last_report >= PROGRESS_INTERVAL:
                     print(f"  {done}/{total_jobs} uploaded", file=sys.stderr)
+                    last_report = now
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            run_phase(pool, _put_one, [j for j in jobs if not is_suite_metadata(j[2])], "PUT")
+
+            # Copies need their source in place; a copy of a failed PUT would
+            # publish the source key's previous content under the new key
+            ready = []
+            for copy in copies:
+                if copy[3] in failed:
+                    errors.append(f"{copy[2]}: not copied, upload of {copy[3]} failed")
+                else:
+                    ready.append(copy)
+            run_phase(pool, _copy_one, ready, "COPY")
+
+            metadata = [j for j in jobs if is_suite_metadata(j[2])]
+            if errors:
+                print(f"  Withholding {len(metadata)} InRelease/index objects after upload errors",
+                      file=sys.stderr)
+            else:
+                run_phase(pool, _put_one, metadata, "PUT")
+
+        print(f"  {done}/{total_jobs} uploaded", file=sys.stderr)
 
         if errors:
             raise RuntimeError(f"{len(errors)} upload(s) failed:\n" + "\n".join(errors))
@@ -177,7 +482,7 @@ def sync(directory: Path, account_id: str, access_key: str,
 
     if stale:
         print(f"Deleting {len(stale)} stale objects...", file=sys.stderr)
-        delete_keys(client, bucket, stale, dry_run)
+        delete_keys(client, bucket, stale, dry_run, workers)
     else:
         print("No stale objects.", file=sys.stderr)
 
@@ -192,6 +497,10 @@ def main():
     parser.add_argument("--secret-key", default=os.environ.get("R2_SECRET_KEY"))
     parser.add_argument("--bucket",     default=os.environ.get("R2_BUCKET"))
     parser.add_argument("--dry-run",    action="store_true")
+    parser.add_argument("--workers",    type=int, default=UPLOAD_WORKERS,
+                        help="Concurrent R2 requests")
+    parser.add_argument("--verbose",    action="store_true",
+                        help="Log every uploaded object")
     args = parser.parse_args()
 
     for name, val in [("--account", args.account), ("--access-key", args.access_key),
@@ -201,7 +510,7 @@ def main():
             sys.exit(1)
 
     sync(Path(args.dir), args.account, args.access_key,
-         args.secret_key, args.bucket, args.dry_run)
+         args.secret_key, args.bucket, args.dry_run, args.workers, args.verbose)
 
 
 if __name__ == "__main__":
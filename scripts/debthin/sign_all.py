@@ -10,7 +10,6 @@ and utilizes native python subprocess calls to batch sign artifacts via gpg.
 import argparse
 import concurrent.futures
 import datetime
-import gzip
 import hashlib
 import json
 import os
@@ -19,10 +18,16 @@ import subprocess
 import sys
 import threading
 import urllib.request
+import zlib
 from typing import Dict, List, Optional, Set, Tuple
 
 print_lock = threading.Lock()
 
+# Release checksum sections, in the order Debian writes them. MD5Sum is not
+# trusted by apt; it is there so r2_upload can match R2 ETags without
+# re-hashing the tree.
+RELEASE_HASHES = {"MD5Sum": "md5", "SHA256": "sha256"}
+
 def log(level: str, msg: str):
     with print_lock:
         if level == "ERROR":
@@ -98,25 +103,60 @@ def parse_inrelease_data(content: str) -> Dict[str, str]:
                 fields[key] = val
     return fields
 
-def compute_hash_and_size(filepath: str, is_gzip: bool = False) -> Tuple[str, int]:
-    h = hashlib.sha256()
-    size = 0
-    if is_gzip:
-        with gzip.open(filepath, "rb") as f:
-            while chunk := f.read(65536):
-                h.update(chunk)
-                size += len(chunk)
-    else:
-        with open(filepath, "rb") as f:
-            while chunk := f.read(65536):
+def hash_packages_gz(filepath: str) -> Tuple[Dict[str, str], int, Dict[str, str], int]:
+    """
+    MD5/SHA256 digests and size of a Packages.gz and of its decompressed
+    Packages, from a single read: each compressed chunk is hashed and fed to
+    the inflater. Concatenated gzip members and NUL padding between them are
+    handled as gzip.open would, and a truncated member raises EOFError.
+    Returns ({algorithm: hex}, size_gz, {algorithm: hex}, size_raw).
+    """
+    h_gz = {a: hashlib.new(a) for a in RELEASE_HASHES.values()}
+    h_raw = {a: hashlib.new(a) for a in RELEASE_HASHES.values()}
+    size_gz = size_raw = 0
+    # None between members, i.e. where the next gzip header would start
+    inflater = None
+    with open(filepath, "rb") as f:
+        while chunk := f.read(65536):
+            for h in h_gz.values():
                 h.update(chunk)
-                size += len(chunk)
-    return h.hexdigest(), size
+            size_gz += len(chunk)
+            while chunk:
+                if inflater is None:
+                    chunk = chunk.lstrip(b"\x00")
+                    if not chunk:
+                        break
+                    inflater = zlib.decompressobj(wbits=31)
+                data = inflater.decompress(chunk)
+                for h in h_raw.values():
+                    h.update(data)
+                size_raw += len(data)
+                chunk = b""
+                if inflater.eof:
+                    chunk = inflater.unused_data
+                    inflater = None
+    if inflater is not None:
+        raise EOFError(f"{filepath}: compressed file ended before the end-of-stream marker was reached")
+    return ({a: h.hexdigest() for a, h in h_gz.items()}, size_gz,
+            {a: h.hexdigest() for a, h in h_raw.items()}, size_raw)
 
-def compute_string_hash_and_size(data: str) -> Tuple[str, int]:
+def compute_string_hashes_and_size(data: str) -> Tuple[Dict[str, str], int]:
     bdata = data.encode("utf-8")
-    h = hashlib.sha256(bdata).hexdigest()
-    return h, len(bdata)
+    return {a: hashlib.new(a, bdata).hexdigest() for a in RELEASE_HASHES.values()}, len(bdata)
+
+def find_packages_gz(root: str) -> List[str]:
+    """
+    Returns every Packages.gz path under root. DirEntry.is_dir/is_file are
+    answered from the directory read itself, so only matches cost a stat later.
+    """
+    found = []
+    with os.scandir(root) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                found.extend(find_packages_gz(entry.path))
+            elif entry.name == "Packages.gz" and entry.is_file():
+                found.append(entry.path)
+    return found
 
 def generate_release(distro: str, upstream_base: str, suite: str, components_csv: str, arches_csv: str, repo_root: str, dist_output: str) -> None:
     dist_dir = os.path.join(dist_output, "dists", distro, suite)
@@ -133,6 +173,7 @@ def generate_release(distro: str, upstream_base: str, suite: str, components_csv
     
     inrelease_cache = os.path.join(repo_root, ".tmp_cache", distro, suite, "InRelease")
     release_output = os.path.join(dist_dir, "Release")
+    packages_files = find_packages_gz(dist_dir)
     
     # Needs Release generation check (cache vs latest packages)
     needs_release = False
@@ -142,15 +183,8 @@ def generate_release(distro: str, upstream_base: str, suite: str, components_csv
         needs_release = True
     else:
         # Check all Packages.gz in the tree
-        for root, _, files in os.walk(dist_dir):
-            for file in files:
-                if file == "Packages.gz":
-                    pkg_path = os.path.join(root, file)
-                    if os.path.getmtime(pkg_path) > os.path.getmtime(release_output):
-                        needs_release = True
-                        break
-            if needs_release:
-                break
+        release_time = os.path.getmtime(release_output)
+        needs_release = any(os.path.getmtime(pf) > release_time for pf in packages_files)
                 
     # Also check script time vs release
     script_path = os.path.abspath(__file__)
@@ -188,24 +222,18 @@ def generate_release(distro: str, upstream_base: str, suite: str, components_csv
         desc = f"Curated server package index for {distro.capitalize()} {suite} - debthin.org"
         
     # Process Packages
-    sha256_lines = []
+    hash_lines: Dict[str, List[str]] = {section: [] for section in RELEASE_HASHES}
     
-    packages_files = []
-    for root, _, files in os.walk(dist_dir):
-        for file in files:
-            if file == "Packages.gz":
-                packages_files.append(os.path.join(root, file))
-                
     for pf in sorted(packages_files):
         rel_path = os.path.relpath(pf, dist_dir)
         rel_base = rel_path[:-3] # remove .gz
         reldir = os.path.dirname(rel_path)
         
-        sha256_gz, size_gz = compute_hash_and_size(pf, is_gzip=False)
-        sha256_raw, size_raw = compute_hash_and_size(pf, is_gzip=True)
+        digests_gz, size_gz, digests_raw, size_raw = hash_packages_gz(pf)
         
-        sha256_lines.append(f" {sha256_gz} {size_gz} {rel_path}")
-        sha256_lines.append(f" {sha256_raw} {size_raw} {rel_base}")
+        for section, algorithm in RELEASE_HASHES.items():
+            hash_lines[section].append(f" {digests_gz[algorithm]} {size_gz} {rel_path}")
+            hash_lines[section].append(f" {digests_raw[algorithm]} {size_raw} {rel_base}")
         
         # Arch Release File Emulation
         arch_dir = os.path.basename(os.path.dirname(pf))
@@ -213,15 +241,16 @@ def generate_release(distro: str, upstream_base: str, suite: str, components_csv
         comp = os.path.basename(os.path.dirname(os.path.dirname(pf)))
         
         arch_release_content = f"Archive: {suite}\nComponent: {comp}\nArchitecture: {arch}\n"
-        sha256_ar, size_ar = compute_string_hash_and_size(arch_release_content)
+        digests_ar, size_ar = compute_string_hashes_and_size(arch_release_content)
         
-        sha256_lines.append(f" {sha256_ar} {size_ar} {reldir}/Release")
+        for section, algorithm in RELEASE_HASHES.items():
+            hash_lines[section].append(f" {digests_ar[algorithm]} {size_ar} {reldir}/Release")
 
     # Pass-through i18n Translation hashes if available
     if upstream_content:
         for line in upstream_content.splitlines():
             if re.match(r"^ [a-f0-9]{64} +[0-9]+ +[^/]+/i18n/Translation-[a-zA-Z0-9_-]+(\.(gz|bz2))?$", line):
-                sha256_lines.append(line)
+                hash_lines["SHA256"].append(line)
         
     release_contents = [
         "Origin: debthin",
@@ -242,10 +271,11 @@ def generate_release(distro: str, upstream_base: str, suite: str, components_csv
         f"Architectures: {arches_csv.replace(',', ' ')}",
         f"Components: {components_csv.replace(',', ' ')}",
         f"Description: {desc}",
-        "SHA256:"
     ])
     
-    release_contents.extend(sha256_lines)
+    for section, lines in hash_lines.items():
+        release_contents.append(f"{section}:")
+        release_contents.extend(lines)
     
     with open(release_output, "w", encoding="utf-8") as f:
         f.write("\n".join(release_contents) + "\n")
@@ -0,0 +1,67 @@
+import contextlib
+import gzip
+import io
+import unittest
+from unittest import mock
+
+import curate
+
+def reference_parse(text: str) -> dict:
+    """Line-by-line parser that fetch_packages_index replaced."""
+    packages = {}
+    current = {}
+    for line in text.splitlines():
+        if line == "":
+            if "Package" in current:
+                packages[current["Package"]] = current
+            current = {}
+        elif line.startswith(" "):
+            pass
+        elif ": " in line:
+            key, _, val = line.partition(": ")
+            current[key] = val
+    if "Package" in current:
+        packages[current["Package"]] = current
+    return packages
+
+def make_index(count: int) -> str:
+    stanzas = []
+    for i in range(count):
+        stanza = f"Package: pkg{i}\nVersion: 1.{i}-1\nSection: {'net' if i % 2 else 'libs'}\n"
+        if i % 3 == 0:
+            stanza += f"Depends: libc6 (>= 2.36), pkg{i + 1}\n"
+        if i % 5 == 0:
+            stanza += "Description: a package\n with a continuation line\n .\n and another\n"
+        stanza += f"Installed-Size: {i * 7}\n"
+        stanzas.append(stanza)
+    return "\n".join(stanzas)
+
+class TestCurate(unittest.TestCase):
+    def fetch(self, text: str, chunk_size: int) -> dict:
+        payload = gzip.compress(text.encode("utf-8"))
+
+        @contextlib.contextmanager
+        def fake_open_url(url):
+            yield io.BytesIO(payload)
+
+        with mock.patch.object(curate, "open_url", fake_open_url), \
+             mock.patch.object(curate, "STREAM_CHUNK_SIZE", chunk_size), \
+             contextlib.redirect_stderr(io.StringIO()):
+            return curate.fetch_packages_index("http://mirror", "trixie", "amd64")
+
+    def test_fetch_packages_index_chunk_boundaries(self):
+        text = make_index(200)
+        expected = reference_parse(text)
+        self.assertEqual(len(expected), 200)
+        # Sizes that put the split point inside fields, on the blank line
+        # separator, and beyond the whole payload
+        for chunk_size in (1, 2, 7, 64, 100, 4096, len(text) + 1):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(self.fetch(text, chunk_size), expected)
+
+    def test_fetch_packages_index_trailing_newlines(self):
+        text = make_index(10) + "\n\n"
+        self.assertEqual(self.fetch(text, 13), reference_parse(text))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import gzip
+import unittest
+import filter
+
+PACKAGES = b"""Package: curl
+Version: 8.5.0-2
+Depends: libcurl4t64 (= 8.5.0-2)
+
+Package: libcurl4t64
+Version: 8.5.0-2
+
+Package: gnome-shell
+Version: 46.0-1
+
+Package: python3.12-minimal
+Version: 3.12.3-1
+"""
+
+class TestFilter(unittest.TestCase):
+    def test_count_packages(self):
+        self.assertEqual(filter.count_packages(PACKAGES), 4)
+
+    def test_generalize_name(self):
+        self.assertEqual(filter.generalize_name(b"libcurl4t64"), b"libcurl4")
+        self.assertEqual(filter.generalize_name(b"python3.12-minimal"), b"python.-minimal")
+
+    def test_iter_stanzas_field_value(self):
+        stanzas = list(filter.iter_stanzas(PACKAGES))
+        self.assertEqual(len(stanzas), 4)
+        start, end = stanzas[0]
+        self.assertEqual(filter.field_value(PACKAGES, start, end), b"curl")
+        self.assertEqual(filter.field_value(PACKAGES, start, end, b"Version: "), b"8.5.0-2")
+        self.assertIsNone(filter.field_value(PACKAGES, start, end, b"Section: "))
+
+    def test_filter_packages(self):
+        allowed = frozenset({b"curl"})
+        gen_allowed = frozenset({filter.generalize_name(b"libcurl4"), filter.generalize_name(b"python3.13-minimal")})
+        filtered, kept = filter.filter_packages(PACKAGES, allowed, gen_allowed)
+        self.assertEqual(kept, 3)
+        self.assertEqual(gzip.decompress(filtered), (
+            b"Package: curl\nVersion: 8.5.0-2\nDepends: libcurl4t64 (= 8.5.0-2)\n\n"
+            b"Package: libcurl4t64\nVersion: 8.5.0-2\n\n"
+            b"Package: python3.12-minimal\nVersion: 3.12.3-1\n\n"
+        ))
+        # No timestamp in the gzip header: re-filtering gives identical bytes
+        self.assertEqual(filtered[4:8], b"\0\0\0\0")
+        self.assertEqual(filter.filter_packages(PACKAGES, allowed, gen_allowed)[0], filtered)
+
+    def test_filter_packages_empty(self):
+        filtered, kept = filter.filter_packages(PACKAGES, frozenset(), frozenset())
+        self.assertEqual(kept, 0)
+        self.assertEqual(gzip.decompress(filtered), b"")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+import contextlib
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+try:
+    import r2_upload
+except ImportError:  # boto3 is only installed in the build venv
+    r2_upload = None
+
+PACKAGES_GZ = gzip.compress(b"Package: curl\nVersion: 8.5.0-2\n", mtime=0)
+
+def md5(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+def sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+class StubClient:
+    """In-memory stand-in for the boto3 S3 client calls sync() makes."""
+
+    def __init__(self, objects=None):
+        # key -> (body, etag)
+        self.objects = {k: (v, md5(v)) for k, v in (objects or {}).items()}
+        self.calls = []
+        self.fail_keys = set()
+
+    def get_paginator(self, name):
+        return self
+
+    def paginate(self, Bucket, Prefix="", Delimiter=None):
+        contents, prefixes = [], set()
+        for key in sorted(self.objects):
+            if not key.startswith(Prefix):
+                continue
+            rest = key[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                prefixes.add(Prefix + rest.split(Delimiter)[0] + Delimiter)
+            else:
+                body, etag = self.objects[key]
+                contents.append({"Key": key, "ETag": f'"{etag}"', "Size": len(body)})
+        yield {"Contents": contents, "CommonPrefixes": [{"Prefix": p} for p in sorted(prefixes)]}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        if Key in self.fail_keys:
+            raise OSError("simulated failure")
+        body = Body if isinstance(Body, bytes) else Body.read()
+        self.calls.append(("put", Key))
+        self.objects[Key] = (body, md5(body))
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.calls.append(("copy", Key, CopySource["Key"]))
+        self.objects[Key] = self.objects[CopySource["Key"]]
+
+    def delete_objects(self, Bucket, Delete):
+        for obj in Delete["Objects"]:
+            self.calls.append(("delete", obj["Key"]))
+            self.objects.pop(obj["Key"], None)
+        return {}
+
+@unittest.skipIf(r2_upload is None, "boto3 not installed")
+class TestR2Upload(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write(self, rel_path: str, data: bytes) -> str:
+        path = os.path.join(self.root, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def write_suite(self, inrelease_packages=PACKAGES_GZ):
+        """debian/trixie with identical Packages.gz for two arches."""
+        self.write("dists/debian/trixie/main/binary-amd64/Packages.gz", PACKAGES_GZ)
+        self.write("dists/debian/trixie/main/binary-arm64/Packages.gz", PACKAGES_GZ)
+        self.write("dists/debian/trixie/Release", b"not uploaded")
+        lines = {"MD5Sum": md5(inrelease_packages), "SHA256": sha256(inrelease_packages)}
+        inrelease = "Origin: debthin\n"
+        for section, digest in lines.items():
+            inrelease += f"{section}:\n"
+            for arch in ("amd64", "arm64"):
+                inrelease += f" {digest} {len(inrelease_packages)} main/binary-{arch}/Packages.gz\n"
+        self.write("dists/debian/trixie/InRelease", inrelease.encode())
+        self.write("index.html", b"<html>")
+
+    def sync(self, client):
+        with mock.patch.object(r2_upload, "make_client", return_value=client), \
+             contextlib.redirect_stderr(io.StringIO()):
+            r2_upload.sync(self.root, "account", "key", "secret", "bucket")
+
+    def test_multipart_etag(self):
+        data = bytes(range(256)) * 10
+        path = self.write("big.gz", data)
+        # 2560 bytes in 1024-byte parts: two full parts and a 512-byte tail
+        parts = [data[:1024], data[1024:2048], data[2048:]]
+        expected = md5(b"".join(hashlib.md5(p).digest() for p in parts)) + "-3"
+        self.assertEqual(r2_upload.multipart_etag(path, part_size=1024), expected)
+
+    def test_hash_file(self):
+        path = self.write("index.html", b"<html>")
+        self.assertEqual(r2_upload.hash_file(path, ["md5", "sha256"]),
+                         {"md5": md5(b"<html>"), "sha256": sha256(b"<html>")})
+
+    def test_is_hash_indexed(self):
+        self.assertTrue(r2_upload.is_hash_indexed("dists/debian/trixie/main/binary-amd64/Packages.gz"))
+        self.assertFalse(r2_upload.is_hash_indexed("dists/debian/trixie/InRelease"))
+        self.assertFalse(r2_upload.is_hash_indexed("Packages.gz"))
+
+    def test_load_release_hashes(self):
+        inrelease = self.write("dists/debian/trixie/InRelease", b"""Origin: debthin
+MD5Sum:
+ 0cc175b9c0f1b6a831c399e269772661 100 main/binary-amd64/Packages.gz
+ 92eb5ffee6ae2fec3ad71c777531578f 7 main/binary-arm64/Packages.gz
+SHA256:
+ ca978112ca1bbdcafac231b39a23dc4da786eff8147c4e72b9807785afee48bb 100 main/binary-amd64/Packages.gz
+ 3e23e8160039594a33894f6564e1b1348bbd7a0088d42c4acb73eeaed59c009d 8 main/binary-arm64/Packages.gz
+""")
+        known = r2_upload.load_release_hashes({"dists/debian/trixie/InRelease": inrelease})
+        self.assertEqual(known["dists/debian/trixie/main/binary-amd64/Packages.gz"], {
+            "size": 100,
+            "md5": "0cc175b9c0f1b6a831c399e269772661",
+            "sha256": "ca978112ca1bbdcafac231b39a23dc4da786eff8147c4e72b9807785afee48bb",
+        })
+        # Sections disagreeing on size: only the first-listed digest is kept
+        self.assertEqual(known["dists/debian/trixie/main/binary-arm64/Packages.gz"],
+                         {"size": 7, "md5": "92eb5ffee6ae2fec3ad71c777531578f"})
+
+    def test_build_hash_indexes(self):
+        indexes = r2_upload.build_hash_indexes({
+            "dists/debian/trixie/main/binary-amd64/Packages.gz": "aa",
+            "dists/ubuntu/noble/main/binary-amd64/Packages.gz": "bb",
+        })
+        self.assertEqual(indexes, {
+            "dists/debian/by-hash-index.json": {"aa": "trixie/main/binary-amd64/Packages.gz"},
+            "dists/ubuntu/by-hash-index.json": {"bb": "noble/main/binary-amd64/Packages.gz"},
+        })
+
+    def test_sync_dedupes_and_orders_uploads(self):
+        self.write_suite()
+        client = StubClient({"index.html": b"<html>", "dists/old/stale": b"x"})
+        with mock.patch.object(r2_upload, "hash_file", wraps=r2_upload.hash_file) as hash_file:
+            self.sync(client)
+
+        amd64 = "dists/debian/trixie/main/binary-amd64/Packages.gz"
+        arm64 = "dists/debian/trixie/main/binary-arm64/Packages.gz"
+        # Packages.gz digests come from InRelease; only index.html is hashed
+        self.assertEqual([c.args[0] for c in hash_file.call_args_list],
+                         [os.path.join(self.root, "index.html")])
+        # Content, then copies, then the metadata referencing them, then deletes
+        self.assertEqual(client.calls[:2], [("put", amd64), ("copy", arm64, amd64)])
+        self.assertEqual(set(client.calls[2:4]), {("put", "dists/debian/by-hash-index.json"),
+                                                  ("put", "dists/debian/trixie/InRelease")})
+        self.assertEqual(client.calls[4:], [("delete", "dists/old/stale")])
+        self.assertNotIn("dists/debian/trixie/Release", client.objects)
+        self.assertEqual(client.objects["dists/debian/by-hash-index.json"][0],
+                         b'{"%s":"trixie/main/binary-arm64/Packages.gz"}' % sha256(PACKAGES_GZ).encode())
+
+        # Everything now matches: a second sync sends nothing
+        client.calls.clear()
+        self.sync(client)
+        self.assertEqual(client.calls, [])
+
+    def test_sync_copies_from_unchanged_remote(self):
+        self.write_suite()
+        amd64 = "dists/debian/trixie/main/binary-amd64/Packages.gz"
+        client = StubClient({amd64: PACKAGES_GZ})
+        self.sync(client)
+        self.assertIn(("copy", "dists/debian/trixie/main/binary-arm64/Packages.gz", amd64), client.calls)
+        self.assertNotIn(("put", amd64), client.calls)
+
+    def test_sync_ignores_stale_inrelease_digests(self):
+        # InRelease sizes that don't match the tree fall back to hashing
+        self.write_suite(inrelease_packages=b"older content")
+        client = StubClient()
+        with mock.patch.object(r2_upload, "hash_file", wraps=r2_upload.hash_file) as hash_file:
+            self.sync(client)
+        hashed = {os.path.relpath(c.args[0], self.root) for c in hash_file.call_args_list}
+        self.assertIn("dists/debian/trixie/main/binary-amd64/Packages.gz", hashed)
+        self.assertIn(b'"%s"' % sha256(PACKAGES_GZ).encode(),
+                      client.objects["dists/debian/by-hash-index.json"][0])
+
+    def test_sync_skips_matching_multipart_etag(self):
+        data = bytes(r2_upload.MULTIPART_CHUNK_SIZE + 1)
+        path = self.write("big.gz", data)
+        client = StubClient()
+        client.objects["big.gz"] = (data, r2_upload.multipart_etag(path))
+        self.assertTrue(client.objects["big.gz"][1].endswith("-2"))
+        self.sync(client)
+        self.assertEqual(client.calls, [])
+
+        # A composite ETag for different content is re-uploaded
+        client.objects["big.gz"] = (data, md5(b"other") + "-2")
+        self.sync(client)
+        self.assertEqual(client.calls, [("put", "big.gz")])
+
+    def test_sync_failed_source_withholds_copy_and_metadata(self):
+        self.write_suite()
+        client = StubClient()
+        client.fail_keys.add("dists/debian/trixie/main/binary-amd64/Packages.gz")
+        with self.assertRaises(RuntimeError):
+            self.sync(client)
+        # No copy of the failed source, and no InRelease or index referencing it
+        self.assertEqual(client.calls, [("put", "index.html")])
+
+if __name__ == "__main__":
+    unittest.main()
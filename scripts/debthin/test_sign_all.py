@@ -1,4 +1,6 @@
 import datetime
+import gzip
+import hashlib
 import os
 import tempfile
 import unittest
@@ -76,5 +78,33 @@ Date: Mon, 30 Mar 2026 12:00:00 UTC
         date_str = sign_all.format_date_rfc2822(dt)
         self.assertEqual(date_str, "Mon, 30 Mar 2026 12:00:00 UTC")
 
+    def test_hash_packages_gz(self):
+        raw = b"".join(b"Package: pkg%d\nVersion: 1.0\n\n" % i for i in range(20000))
+        # Two concatenated members, as gzip.open reads them
+        packed = gzip.compress(raw[:1000], mtime=0) + gzip.compress(raw[1000:], mtime=0)
+        path = os.path.join(self.temp_dir.name, "Packages.gz")
+        with open(path, "wb") as f:
+            f.write(packed)
+
+        self.assertEqual(
+            sign_all.hash_packages_gz(path),
+            ({"md5": hashlib.md5(packed).hexdigest(), "sha256": hashlib.sha256(packed).hexdigest()}, len(packed),
+             {"md5": hashlib.md5(raw).hexdigest(), "sha256": hashlib.sha256(raw).hexdigest()}, len(raw)),
+        )
+
+        # NUL padding between and after members is skipped, as gzip.open does
+        padded = gzip.compress(raw[:1000], mtime=0) + b"\x00" * 100 + gzip.compress(raw[1000:], mtime=0) + b"\x00" * 70000
+        with open(path, "wb") as f:
+            f.write(padded)
+        digests_gz, size_gz, digests_raw, size_raw = sign_all.hash_packages_gz(path)
+        self.assertEqual((digests_gz["sha256"], size_gz), (hashlib.sha256(padded).hexdigest(), len(padded)))
+        self.assertEqual((digests_raw["sha256"], size_raw), (hashlib.sha256(raw).hexdigest(), len(raw)))
+
+        # A truncated file must fail rather than hash a partial Packages
+        with open(path, "wb") as f:
+            f.write(packed[:-100])
+        with self.assertRaises(EOFError):
+            sign_all.hash_packages_gz(path)
+
 if __name__ == "__main__":
     unittest.main()
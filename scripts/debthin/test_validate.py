@@ -44,6 +44,8 @@ Hash: SHA512
 
 Origin: DebThin
 
+MD5Sum:
+ 0cc175b9c0f1b6a831c399e269772661 2147 main/binary-amd64/Packages.gz
 SHA256:
  073a9eb6cfec157a8a184e917d0bb2be7839db080b0edfac7e6e2f139fb2bca2 2147 main/binary-amd64/Packages.gz
  1234567890abcdef1234567890abcdef1234567890abcdef1234567890abcdef 1024 universe/binary-amd64/Packages.gz
@@ -58,5 +60,17 @@ SHA256:
         self.assertEqual(hashes[0], ("073a9eb6cfec157a8a184e917d0bb2be7839db080b0edfac7e6e2f139fb2bca2", 2147, "main/binary-amd64/Packages.gz"))
         self.assertEqual(hashes[2], ("7f83b1657ff1fc53b92dc18148a1d65dfc2d4b1fa3d677284addd200126d9069", 50, "main/i18n/Translation-en"))
 
+        md5s = validate.parse_inrelease_hashes(self.inrelease_path, "MD5Sum")
+        self.assertEqual(md5s, [("0cc175b9c0f1b6a831c399e269772661", 2147, "main/binary-amd64/Packages.gz")])
+
+    def test_compute_digests(self):
+        path = os.path.join(self.temp_dir.name, "Packages.gz")
+        with open(path, "wb") as f:
+            f.write(b"a" * 100000)
+        self.assertEqual(validate.compute_digests(path), {
+            "md5": "1af6d6f2f682f76f80e606aeaaee1680",
+            "sha256": "6d1cf22d7cc09b085dfc25ee1a1f3ae0265804c607bc2074ad253bcc82fd81ee",
+        })
+
 if __name__ == "__main__":
     unittest.main()
@@ -88,13 +88,15 @@ def check_config_json(f: str):
         
     pass_msg(f"{f} (JSON valid, stable suite: {stable_suite})")
 
-def compute_sha256(filepath: str) -> str:
-    sha256_hash = hashlib.sha256()
+def compute_digests(filepath: str) -> Dict[str, str]:
+    """MD5 and SHA256 of a file in one read, for the InRelease MD5Sum/SHA256 sections."""
+    hashers = {"md5": hashlib.md5(), "sha256": hashlib.sha256()}
     with open(filepath, "rb") as f:
         # Read in blocks to avoid memory issues with huge files
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
-    return sha256_hash.hexdigest()
+        for byte_block in iter(lambda: f.read(65536), b""):
+            for h in hashers.values():
+                h.update(byte_block)
+    return {a: h.hexdigest() for a, h in hashers.items()}
 
 def count_packages_gzip(filepath: str) -> int:
     try:
@@ -122,18 +124,18 @@ def parse_inrelease(filepath: str) -> Dict[str, str]:
                 fields[key.strip()] = val.strip()
     return fields
 
-def parse_inrelease_hashes(filepath: str) -> List[Tuple[str, int, str]]:
+def parse_inrelease_hashes(filepath: str, section: str = "SHA256") -> List[Tuple[str, int, str]]:
     hashes = []
     if not os.path.exists(filepath):
         return hashes
         
-    in_sha256 = False
+    in_section = False
     with open(filepath, "r", encoding="utf-8", errors="ignore") as f:
         for line in f:
-            if line.startswith("SHA256:"):
-                in_sha256 = True
+            if line.startswith(f"{section}:"):
+                in_section = True
                 continue
-            if in_sha256:
+            if in_section:
                 if line.startswith(" "):
                     parts = line.strip().split()
                     if len(parts) >= 3:
@@ -142,7 +144,7 @@ def parse_inrelease_hashes(filepath: str) -> List[Tuple[str, int, str]]:
                         rel_path = " ".join(parts[2:])
                         hashes.append((expect_hash, expect_size, rel_path))
                 elif line.strip() and not line.startswith(" "):
-                    in_sha256 = False
+                    in_section = False
     return hashes
 
 class DistroResult:
@@ -218,6 +220,8 @@ def validate_distro(distro_dir: str, cache_dir: str = None) -> DistroResult:
                 
         # InRelease hash verification
         if os.path.exists(inrelease):
+            # r2_upload skips objects on these MD5s alone, so they are checked too
+            md5s = {rel_path: (md5, size) for md5, size, rel_path in parse_inrelease_hashes(inrelease, "MD5Sum")}
             for expect_hash, expect_size, rel_path in hashes:
                 if "/by-hash/" in rel_path or "/i18n/" in rel_path or not rel_path.endswith(".gz"):
                     continue
@@ -228,12 +232,15 @@ def validate_distro(distro_dir: str, cache_dir: str = None) -> DistroResult:
                     continue
                     
                 actual_size = os.path.getsize(full_path)
-                actual_hash = compute_sha256(full_path)
+                digests = compute_digests(full_path)
+                expect_md5 = md5s.get(rel_path)
                 
-                if actual_hash != expect_hash:
+                if digests["sha256"] != expect_hash:
                     result.fail_msg(f"SHA256 mismatch: {rel_path}")
                 elif actual_size != expect_size:
                     result.fail_msg(f"size mismatch: {rel_path} (expected {expect_size} got {actual_size})")
+                elif expect_md5 and expect_md5 != (digests["md5"], actual_size):
+                    result.fail_msg(f"MD5Sum mismatch: {rel_path}")
 
         # Packages.gz checks
         packages_gz_files = []